@@ -7,11 +7,19 @@ import os
 import time
 import json
 import signal
+import asyncio
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 import ccxt
+import ccxt.async_support as ccxt_async
+import ccxt.pro as ccxt_pro
 
 try:
     import zoneinfo
@@ -19,6 +27,14 @@ try:
 except Exception:
     _has_zoneinfo = False
 
+try:
+    import orjson
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except Exception:
+    def dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
 from telegram_notifier import TelegramNotifier
 
 # ---------------------------
@@ -32,88 +48,218 @@ def getenv_float(key: str, default: float) -> float:
     v = os.getenv(key)
     try:
         return float(v)
-    except Exception:
+    except (TypeError, ValueError):
         return float(default)
 
 def getenv_int(key: str, default: int) -> int:
     v = os.getenv(key)
     try:
         return int(v)
-    except Exception:
+    except (TypeError, ValueError):
         return int(default)
 
+def load_tz():
+    if not _has_zoneinfo:
+        return timezone.utc
+    try:
+        return zoneinfo.ZoneInfo(getenv_str("TIMEZONE", "UTC"))
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError, OSError):
+        # Zona inválida (p. ej. un directorio como "America"): se sigue en UTC
+        return timezone.utc
+
+# TIMEZONE se resuelve una sola vez al arrancar
+_TZ = load_tz()
+
 def now_tz():
-    tzname = getenv_str("TIMEZONE", "UTC")
-    if _has_zoneinfo:
-        try:
-            tz = zoneinfo.ZoneInfo(tzname)
-        except Exception:
-            tz = timezone.utc
-    else:
-        tz = timezone.utc
-    return datetime.now(tz)
+    return datetime.now(_TZ)
 
 # ---------------------------
 # Configuración
 # ---------------------------
-EXCHANGE_ID = getenv_str("EXCHANGE", "coinex").lower()
-LIVE = getenv_int("LIVE", 0)
-TIMEFRAME = getenv_str("TIMEFRAME", "1m")
-SYMBOLS = [s.strip() for s in getenv_str("SYMBOLS", "BTC/USDT:USDT,ETH/USDT:USDT").split(",") if s.strip()]
-FEE_RATE = getenv_float("FEE_RATE", 0.0005)
-
-RSI_PERIOD = getenv_int("RSI_PERIOD", 14)
-RSI_BUY_THRESHOLD = getenv_float("RSI_BUY_THRESHOLD", 30.0)
-RSI_SELL_THRESHOLD = getenv_float("RSI_SELL_THRESHOLD", 70.0)
-RSI_HYST = getenv_float("RSI_HYSTERESIS", 3.0)
-
-TAKE_PROFIT_PCT = getenv_float("TAKE_PROFIT_PCT", 1.5)
-STOP_LOSS_PCT = getenv_float("STOP_LOSS_PCT", 1.0)
-
-TP_PARTIAL_PCT = getenv_float("TP_PARTIAL_PCT", 40.0)
-ENABLE_BE = getenv_int("ENABLE_BREAKEVEN", 1) == 1
-BE_TRIGGER_PCT = getenv_float("BE_TRIGGER_PCT", 0.60)
-BE_OFFSET_PCT = getenv_float("BE_OFFSET_PCT", 0.05)
-
-ENABLE_TRAIL = getenv_int("ENABLE_TRAIL", 1) == 1
-TRAIL_TRIGGER_PCT = getenv_float("TRAIL_TRIGGER_PCT", 1.00)
-TRAIL_STEP_PCT = getenv_float("TRAIL_STEP_PCT", 0.25)
-
-SIGNAL_COOLDOWN = getenv_int("SIGNAL_COOLDOWN", 300)
-TIMEOUT_MIN = getenv_int("TIMEOUT_MIN", 25)
-LOSS_COOLDOWN_SEC = getenv_int("LOSS_COOLDOWN_SEC", 900)
-
-CAP_A = min(getenv_float("CAPITAL_AGRESIVO", 20.0), 1000.0)
-LOTS_A = max(1, getenv_int("LOT_SIZE_AGRESIVO", 3))
-
-CAP_M = min(getenv_float("CAPITAL_MODERADO", 20.0), 1000.0)
-LOTS_M = max(1, getenv_int("LOT_SIZE_MODERADO", 4))
-
-CAP_C = min(getenv_float("CAPITAL_CONSERVADOR", 20.0), 1000.0)
-LOTS_C = max(1, getenv_int("LOT_SIZE_CONSERVADOR", 5))
-
-TELEGRAM_TOKEN = getenv_str("TELEGRAM_TOKEN", "")
-TELEGRAM_ALLOWED_IDS = [i.strip() for i in getenv_str("TELEGRAM_ALLOWED_IDS", "").split(",") if i.strip()]
-
-POLL_SEC = getenv_int("POLL_SEC", 5)
+@dataclass(frozen=True, slots=True)
+class Cfg:
+    exchange_id: str
+    live: int
+    timeframe: str
+    timeframe_ms: int
+    symbols: tuple
+    fee_rate: float
+
+    rsi_period: int
+    rsi_buy_threshold: float
+    rsi_sell_threshold: float
+    rsi_hyst: float
+
+    take_profit_pct: float
+    stop_loss_pct: float
+
+    tp_partial_pct: float
+    enable_be: bool
+    be_trigger_pct: float
+    be_offset_pct: float
+
+    enable_trail: bool
+    trail_trigger_pct: float
+    trail_step_pct: float
+
+    signal_cooldown: int
+    timeout_min: int
+    loss_cooldown_sec: int
+
+    cap_a: float
+    lots_a: int
+    cap_m: float
+    lots_m: int
+    cap_c: float
+    lots_c: int
+
+    telegram_token: str
+    telegram_allowed_ids: tuple
+
+    poll_sec: int
+    initial_capital: float
+    log_json: bool
+    ws_feed: bool
+
+    # Multiplicadores por lado (long, short), indexados con SIDE_IDX
+    tp_mul: tuple
+    sl_mul: tuple
+    be_mul: tuple
+    trail_mul: tuple
+    tp_partial_frac: float
+    # Umbrales y constantes ya resueltos para el camino caliente
+    rsi_long_below: float
+    rsi_short_above: float
+    timeout_sec: float
+    fee_round_trip: float
+
+def load_config() -> Cfg:
+    timeframe = getenv_str("TIMEFRAME", "1m")
+    take_profit_pct = getenv_float("TAKE_PROFIT_PCT", 1.5)
+    stop_loss_pct = getenv_float("STOP_LOSS_PCT", 1.0)
+    tp_partial_pct = getenv_float("TP_PARTIAL_PCT", 40.0)
+    be_offset_pct = getenv_float("BE_OFFSET_PCT", 0.05)
+    trail_step_pct = getenv_float("TRAIL_STEP_PCT", 0.25)
+    fee_rate = getenv_float("FEE_RATE", 0.0005)
+    rsi_buy_threshold = getenv_float("RSI_BUY_THRESHOLD", 30.0)
+    rsi_sell_threshold = getenv_float("RSI_SELL_THRESHOLD", 70.0)
+    rsi_hyst = getenv_float("RSI_HYSTERESIS", 3.0)
+    timeout_min = getenv_int("TIMEOUT_MIN", 25)
+    return Cfg(
+        exchange_id=getenv_str("EXCHANGE", "coinex").lower(),
+        live=getenv_int("LIVE", 0),
+        timeframe=timeframe,
+        timeframe_ms=int(ccxt.Exchange.parse_timeframe(timeframe) * 1000),
+        symbols=tuple(s.strip() for s in getenv_str("SYMBOLS", "BTC/USDT:USDT,ETH/USDT:USDT").split(",") if s.strip()),
+        fee_rate=fee_rate,
+
+        rsi_period=getenv_int("RSI_PERIOD", 14),
+        rsi_buy_threshold=rsi_buy_threshold,
+        rsi_sell_threshold=rsi_sell_threshold,
+        rsi_hyst=rsi_hyst,
+
+        take_profit_pct=take_profit_pct,
+        stop_loss_pct=stop_loss_pct,
+
+        tp_partial_pct=tp_partial_pct,
+        enable_be=getenv_int("ENABLE_BREAKEVEN", 1) == 1,
+        be_trigger_pct=getenv_float("BE_TRIGGER_PCT", 0.60),
+        be_offset_pct=be_offset_pct,
+
+        enable_trail=getenv_int("ENABLE_TRAIL", 1) == 1,
+        trail_trigger_pct=getenv_float("TRAIL_TRIGGER_PCT", 1.00),
+        trail_step_pct=trail_step_pct,
+
+        signal_cooldown=getenv_int("SIGNAL_COOLDOWN", 300),
+        timeout_min=timeout_min,
+        loss_cooldown_sec=getenv_int("LOSS_COOLDOWN_SEC", 900),
+
+        cap_a=min(getenv_float("CAPITAL_AGRESIVO", 20.0), 1000.0),
+        lots_a=max(1, getenv_int("LOT_SIZE_AGRESIVO", 3)),
+        cap_m=min(getenv_float("CAPITAL_MODERADO", 20.0), 1000.0),
+        lots_m=max(1, getenv_int("LOT_SIZE_MODERADO", 4)),
+        cap_c=min(getenv_float("CAPITAL_CONSERVADOR", 20.0), 1000.0),
+        lots_c=max(1, getenv_int("LOT_SIZE_CONSERVADOR", 5)),
+
+        telegram_token=getenv_str("TELEGRAM_TOKEN", ""),
+        telegram_allowed_ids=tuple(i.strip() for i in getenv_str("TELEGRAM_ALLOWED_IDS", "").split(",") if i.strip()),
+
+        poll_sec=getenv_int("POLL_SEC", 5),
+        # Capital inicial para paper trading
+        initial_capital=getenv_float("INITIAL_CAPITAL", 20.0),
+        log_json=getenv_int("LOG_JSON", 0) == 1,
+        ws_feed=getenv_int("WS_FEED", 0) == 1,
+
+        tp_mul=(1.0 + take_profit_pct / 100.0, 1.0 - take_profit_pct / 100.0),
+        sl_mul=(1.0 - stop_loss_pct / 100.0, 1.0 + stop_loss_pct / 100.0),
+        be_mul=(1.0 + be_offset_pct / 100.0, 1.0 - be_offset_pct / 100.0),
+        trail_mul=(1.0 - trail_step_pct / 100.0, 1.0 + trail_step_pct / 100.0),
+        tp_partial_frac=max(0.0, min(tp_partial_pct, 100.0)) / 100.0,
+        rsi_long_below=rsi_buy_threshold - rsi_hyst,
+        rsi_short_above=rsi_sell_threshold + rsi_hyst,
+        timeout_sec=timeout_min * 60.0,
+        fee_round_trip=fee_rate * 2.0,
+    )
 
-# Capital inicial para paper trading
-INITIAL_CAPITAL = getenv_float("INITIAL_CAPITAL", 20.0)
+CFG = load_config()
 
 # ---------------------------
 # Logging
 # ---------------------------
+LOG_FORMAT = "[{asctime}] [{levelname}] {message}"
+LOG_DATEFMT = "%Y-%m-%d %H:%M:%S%z"
+
 logging.basicConfig(
     level=logging.INFO,
-    format="[{asctime}] [{levelname}] {message}",
+    format=LOG_FORMAT,
     style="{",
-    datefmt="%Y-%m-%d %H:%M:%S%z",
+    datefmt=LOG_DATEFMT,
 )
+
+class CachedTimeFormatter(logging.Formatter):
+    # strftime una vez por segundo; los registros del mismo segundo reutilizan el sello
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stamp = (None, "")
+
+    def formatTime(self, record, datefmt=None):
+        sec = int(record.created)
+        cached_sec, text = self._stamp
+        if sec != cached_sec:
+            text = super().formatTime(record, datefmt)
+            self._stamp = (sec, text)
+        return text
+
+class JsonFormatter(CachedTimeFormatter):
+    # Una línea JSON por registro; `symbol`/`mode` llegan vía extra={...}
+    EXTRA_KEYS = ("symbol", "mode")
+
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record, self.datefmt),
+            "lvl": record.levelname,
+            "msg": record.getMessage(),
+        }
+        for key in self.EXTRA_KEYS:
+            value = getattr(record, key, None)
+            if value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return dumps(payload)
+
+if CFG.log_json:
+    _formatter = JsonFormatter(datefmt=LOG_DATEFMT)
+else:
+    _formatter = CachedTimeFormatter(LOG_FORMAT, LOG_DATEFMT, style="{")
+for _handler in logging.getLogger().handlers:
+    _handler.setFormatter(_formatter)
+
 log = logging.getLogger("bot")
 
 notifier = TelegramNotifier(
-    token=TELEGRAM_TOKEN,
-    allowed_chat_ids=TELEGRAM_ALLOWED_IDS
+    token=CFG.telegram_token,
+    allowed_chat_ids=CFG.telegram_allowed_ids
 )
 
 # ---------------------------
@@ -125,15 +271,20 @@ def is_swap_symbol(market) -> bool:
     t = market.get("type")
     return t == "swap"
 
-def build_exchange():
+def build_exchange(module=ccxt):
     kwargs = {"enableRateLimit": True}
-    ex_class = getattr(ccxt, EXCHANGE_ID)
+    ex_class = getattr(module, CFG.exchange_id)
     exchange = ex_class(kwargs)
     api_key = os.getenv("API_KEY")
     api_secret = os.getenv("API_SECRET")
-    if LIVE == 1 and api_key and api_secret:
+    if CFG.live == 1 and api_key and api_secret:
         exchange.apiKey = api_key
         exchange.secret = api_secret
+    if module is ccxt:
+        # Pool keep-alive para el cliente síncrono (órdenes); el async ya reutiliza conexiones vía aiohttp
+        adapter = HTTPAdapter(pool_connections=len(CFG.symbols) * 2, pool_maxsize=len(CFG.symbols) * 4)
+        exchange.session.mount("https://", adapter)
+        exchange.session.headers["Connection"] = "keep-alive"
     return exchange
 
 exchange = build_exchange()
@@ -141,172 +292,391 @@ markets = {}
 try:
     markets = exchange.load_markets()
 except Exception as e:
-    log.warning(f"No se pudieron cargar mercados: {e}")
-
-def rsi(values, period=14):
+    log.warning("No se pudieron cargar mercados: %s", e)
+
+# Cliente async solo para datos de mercado; las órdenes siguen por `exchange`.
+# Con WS_FEED=1 se usa la clase de ccxt.pro, que además de REST expone watch_*.
+data_exchange = build_exchange(ccxt_pro if CFG.ws_feed else ccxt_async)
+if markets:
+    data_exchange.set_markets(markets, exchange.currencies)
+
+def build_price_formats():
+    # Decimales de precio por símbolo a partir de la precisión del mercado, para los mensajes
+    fmts = {}
+    for s in CFG.symbols:
+        p = (markets.get(s) or {}).get("precision", {}).get("price")
+        if p is None:
+            continue
+        if exchange.precisionMode == ccxt.TICK_SIZE:
+            decimals = exchange.precision_from_string(exchange.number_to_string(p))
+        else:
+            decimals = int(p)
+        fmts[s] = f"{{:,.{decimals}f}}"
+    return fmts
+
+notifier.price_formats.update(build_price_formats())
+
+# Metadatos de mercado fijos, resueltos una vez tras load_markets
+SWAP_SYMBOLS = frozenset(s for s in CFG.symbols if is_swap_symbol(markets.get(s)))
+LEVERAGE = 3
+# Símbolos swap cuyo modo de margen / apalancamiento ya no hace falta volver a enviar
+margin_mode_ready = set()
+leverage_ready = set()
+
+def build_tickers_params():
+    # CoinEx devuelve todos los tickers del tipo de mercado salvo que se filtre por `market` (máx. 10 ids)
+    if CFG.exchange_id != "coinex" or len(CFG.symbols) > 10:
+        return {}
+    ids = [markets[s]["id"] for s in CFG.symbols if s in markets]
+    if len(ids) != len(CFG.symbols):
+        return {}
+    return {"market": ",".join(ids)}
+
+TICKERS_PARAMS = build_tickers_params()
+
+WARMUP_BARS = 200
+
+def wilder_step(avg_gain: float, avg_loss: float, ch: float, period: int):
+    avg_gain = (avg_gain * (period - 1) + max(ch, 0.0)) / period
+    avg_loss = (avg_loss * (period - 1) + max(-ch, 0.0)) / period
+    return avg_gain, avg_loss
+
+def wilder_averages(values, period=14):
     if len(values) <= period:
         return None
-    gains = []
-    losses = []
-    for i in range(1, len(values)):
-        ch = values[i] - values[i - 1]
-        gains.append(max(ch, 0.0))
-        losses.append(max(-ch, 0.0))
-    avg_gain = sum(gains[:period]) / period
-    avg_loss = sum(losses[:period]) / period
-    for i in range(period, len(values) - 1):
-        avg_gain = (avg_gain * (period - 1) + gains[i]) / period
-        avg_loss = (avg_loss * (period - 1) + losses[i]) / period
+    deltas = np.diff(np.asarray(values, dtype=np.float64))
+    gains = np.maximum(deltas, 0.0)
+    losses = np.maximum(-deltas, 0.0)
+    avg_gain = gains[:period].mean()
+    avg_loss = losses[:period].mean()
+    tail = len(deltas) - period
+    if tail > 0:
+        # Wilder es un IIR de primer orden: avg_n = a^n·avg_0 + Σ a^(n-1-k)·x_k / p
+        a = (period - 1) / period
+        weights = a ** np.arange(tail - 1, -1, -1, dtype=np.float64) / period
+        decay = a ** tail
+        avg_gain = decay * avg_gain + weights @ gains[period:]
+        avg_loss = decay * avg_loss + weights @ losses[period:]
+    return float(avg_gain), float(avg_loss)
+
+def rsi_from_averages(avg_gain: float, avg_loss: float) -> float:
     if avg_loss == 0:
         return 100.0
     rs = avg_gain / avg_loss
     return 100.0 - (100.0 / (1 + rs))
 
-def fetch_price_and_rsi(symbol: str):
-    try:
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe=TIMEFRAME, limit=200)
-        closes = [c[4] for c in ohlcv]
-        last_close = closes[-1]
-        the_rsi = rsi(closes, RSI_PERIOD)
-        return float(last_close), float(the_rsi) if the_rsi is not None else None
-    except Exception as e:
-        log.warning(f"fetch_ohlcv fallo {symbol}: {e}")
+# symbol -> (avg_gain, avg_loss, last_close, last_candle_ts) de la última vela cerrada
+rsi_state = {}
+
+def seed_rsi_state(symbol: str, ohlcv) -> bool:
+    # ohlcv[-1] es la vela en formación; el estado solo guarda velas cerradas
+    closes = np.asarray(ohlcv[:-1], dtype=np.float64)[:, 4] if len(ohlcv) > 1 else ()
+    avgs = wilder_averages(closes, CFG.rsi_period)
+    if avgs is None:
+        rsi_state.pop(symbol, None)
+        return False
+    rsi_state[symbol] = (avgs[0], avgs[1], float(closes[-1]), ohlcv[-2][0])
+    return True
+
+def advance_rsi_state(symbol: str, ohlcv) -> bool:
+    """Incorpora la última vela cerrada; False si hay un hueco y hay que re-sembrar."""
+    if len(ohlcv) < 2:
+        return False
+    avg_gain, avg_loss, last_close, last_ts = rsi_state[symbol]
+    bar_ts = ohlcv[-2][0]
+    if bar_ts == last_ts:
+        return True
+    if bar_ts != last_ts + CFG.timeframe_ms:
+        return False
+    bar_close = float(ohlcv[-2][4])
+    avg_gain, avg_loss = wilder_step(avg_gain, avg_loss, bar_close - last_close, CFG.rsi_period)
+    rsi_state[symbol] = (avg_gain, avg_loss, bar_close, bar_ts)
+    return True
+
+def live_rsi(symbol: str, price: float) -> float:
+    # Paso de Wilder con la vela en formación, sin modificar el estado
+    avg_gain, avg_loss, last_close, _ = rsi_state[symbol]
+    return rsi_from_averages(*wilder_step(avg_gain, avg_loss, price - last_close, CFG.rsi_period))
+
+def last_closed_bar_ts() -> int:
+    now_ms = int(time.time() * 1000)
+    return now_ms - now_ms % CFG.timeframe_ms - CFG.timeframe_ms
+
+class FetchBackoff:
+    """Pausa adaptativa (AIMD) de un refresco REST tras errores de red o de límite."""
+    __slots__ = ("delay", "until", "ok_streak")
+
+    MAX_DELAY = 30.0
+    OK_TO_SHRINK = 5
+
+    def __init__(self):
+        self.delay = 0.0
+        self.until = 0.0
+        self.ok_streak = 0
+
+    def ready(self, now: float) -> bool:
+        return now >= self.until
+
+    def failed(self, e, now: float):
+        # RateLimitExceeded y DDoSProtection heredan de NetworkError
+        if not isinstance(e, ccxt.NetworkError):
+            return
+        self.delay = min(self.MAX_DELAY, max(1.0, self.delay * 2.0))
+        self.until = now + self.delay
+        self.ok_streak = 0
+        log.warning("Errores de red/límite: refresco en pausa %.1fs", self.delay)
+
+    def succeeded(self):
+        if not self.delay:
+            return
+        self.ok_streak += 1
+        if self.ok_streak >= self.OK_TO_SHRINK:
+            self.delay = self.delay / 2.0 if self.delay > 1.0 else 0.0
+            self.ok_streak = 0
+
+# Pausa por símbolo para el refresco de velas; los cierres siguen a ritmo de POLL_SEC
+ohlcv_backoff = {s: FetchBackoff() for s in CFG.symbols}
+
+# symbol -> (last, ts monotónico) empujado por el websocket de tickers
+stream_prices = {}
+
+def stream_stale_after() -> float:
+    return max(30.0, 3.0 * CFG.poll_sec)
+
+async def watch_prices():
+    # Solo precio: CoinEx no ofrece watchOHLCV en ccxt.pro; el RSI sigue por REST una vez por vela
+    while _running:
         try:
-            t = exchange.fetch_ticker(symbol)
+            tickers = await data_exchange.watch_tickers(list(CFG.symbols))
+        except Exception as e:
+            log.warning("watch_tickers fallo: %s", e)
+            await asyncio.sleep(CFG.poll_sec)
+            continue
+        now = time.monotonic()
+        for symbol, t in tickers.items():
             last = t.get("last") or t.get("close")
-            return float(last), None
-        except Exception as e2:
-            log.error(f"fetch_ticker fallo {symbol}: {e2}")
-            return None, None
+            if last is not None:
+                stream_prices[symbol] = (float(last), now)
+
+async def fetch_prices():
+    """Último precio de todos los SYMBOLS en una sola llamada; {} si no está disponible."""
+    if stream_prices:
+        now = time.monotonic()
+        fresh = {s: p for s, (p, ts) in stream_prices.items() if now - ts <= stream_stale_after()}
+        if len(fresh) == len(CFG.symbols):
+            return fresh
+    if not data_exchange.has.get("fetchTickers"):
+        return {}
+    try:
+        tickers = await data_exchange.fetch_tickers(list(CFG.symbols), TICKERS_PARAMS)
+    except Exception as e:
+        log.warning("fetch_tickers fallo: %s", e)
+        return {}
+    prices = {}
+    for symbol in CFG.symbols:
+        t = tickers.get(symbol) or {}
+        last = t.get("last") or t.get("close")
+        if last is not None:
+            prices[symbol] = float(last)
+    return prices
+
+async def fetch_ticker_price(symbol: str) -> float:
+    t = await data_exchange.fetch_ticker(symbol)
+    last = t.get("last") or t.get("close")
+    return float(last)
+
+async def ticker_price_or_none(symbol: str):
+    try:
+        return await fetch_ticker_price(symbol)
+    except Exception as e:
+        log.warning("fetch_ticker fallo %s: %s", symbol, e, extra={"symbol": symbol})
+        return None
+
+async def fetch_price_and_rsi(symbol: str, closed_ts: int, price=None):
+    # Dentro de la misma vela basta el precio del ticker: las velas cerradas no cambian
+    state = rsi_state.get(symbol)
+    if state is not None and state[3] >= closed_ts:
+        if price is None:
+            price = await ticker_price_or_none(symbol)
+        if price is not None:
+            return price, live_rsi(symbol, price)
+    backoff = ohlcv_backoff[symbol]
+    if not backoff.ready(time.monotonic()):
+        # Velas en pausa tras errores: solo precio (gestión de cierres), sin RSI
+        return (price if price is not None else await ticker_price_or_none(symbol)), None
+    try:
+        warm = symbol in rsi_state
+        limit = 2 if warm else WARMUP_BARS
+        ohlcv = await data_exchange.fetch_ohlcv(symbol, timeframe=CFG.timeframe, limit=limit)
+        if warm and not advance_rsi_state(symbol, ohlcv):
+            ohlcv = await data_exchange.fetch_ohlcv(symbol, timeframe=CFG.timeframe, limit=WARMUP_BARS)
+            warm = False
+        if not warm:
+            warm = seed_rsi_state(symbol, ohlcv)
+        backoff.succeeded()
+        last_close = float(ohlcv[-1][4])
+        return last_close, live_rsi(symbol, last_close) if warm else None
+    except Exception as e:
+        backoff.failed(e, time.monotonic())
+        log.warning("fetch_ohlcv fallo %s: %s", symbol, e, extra={"symbol": symbol})
+        return (price if price is not None else await ticker_price_or_none(symbol)), None
 
 # ---------------------------
 # Estado global
 # ---------------------------
+@dataclass(slots=True)
 class Position:
-    def __init__(self, symbol, mode, side, qty, entry, tp, sl, opened_ts, notional):
-        self.symbol = symbol
-        self.mode = mode
-        self.side = side
-        self.qty = qty
-        self.entry = entry
-        self.tp = tp
-        self.sl = sl
-        self.opened_ts = opened_ts
-        self.notional = notional
-        self.closed = False
-        self.closed_ts = None
-        self.reason = ""
-        self.partial_done = False
-        self.be_armed = False
-        self.trail_armed = False
-        self.trail_stop = None
+    symbol: str
+    mode: str
+    side: str
+    qty: float
+    entry: float
+    tp: float
+    sl: float
+    opened_ts: float
+    notional: float
+    closed: bool = False
+    closed_ts: float | None = None
+    reason: str = ""
+    partial_done: bool = False
+    be_armed: bool = False
+    trail_armed: bool = False
+    trail_stop: float | None = None
+    # Orden LIVE enviada y sin respuesta todavía
+    pending_order: bool = False
+    # +1.0 long / -1.0 short: las comprobaciones de precio no ramifican por lado
+    sign: float = field(init=False)
+    side_idx: int = field(init=False)
+
+    def __post_init__(self):
+        self.sign = SIDE_SIGN[self.side]
+        self.side_idx = SIDE_IDX[self.side]
 
     def __repr__(self):
         return f"<Pos {self.symbol} {self.mode} {self.side} qty={self.qty} @ {self.entry}>"
 
-positions = {}
-last_signal_ts = {}
+MODES = [
+    ("agresivo", CFG.cap_a, CFG.lots_a),
+    ("moderado", CFG.cap_m, CFG.lots_m),
+    ("conservador", CFG.cap_c, CFG.lots_c),
+]
+
+# Índices enteros fijos para (símbolo, modo, lado)
+SYMBOL_IDX = {s: i for i, s in enumerate(CFG.symbols)}
+MODE_IDX = {m[0]: i for i, m in enumerate(MODES)}
+MODE_LOTS = {m[0]: m[2] for m in MODES}
+SIDE_IDX = {"long": 0, "short": 1}
+SIDE_SIGN = {"long": 1.0, "short": -1.0}
+
+# positions[symbol_idx][mode_idx] -> Position | None
+positions = [[None] * len(MODES) for _ in CFG.symbols]
+# last_signal_ts[symbol_idx][mode_idx][side_idx] -> ts monotónico
+last_signal_ts = [[[float("-inf")] * 2 for _ in MODES] for _ in CFG.symbols]
 last_loss_ts = 0
 
+# Posiciones cerradas recientes (solo auditoría); el slot en `positions` se libera
+closed_positions = deque(maxlen=1024)
+
 pnl_counters = {"trades": 0, "wins": 0, "losses": 0, "gross": 0.0, "fees": 0.0, "pnl": 0.0}
 
-current_capital = INITIAL_CAPITAL
+current_capital = CFG.initial_capital
 hourly_stats = {
-    "start_time": time.time(),
+    "start_time": time.monotonic(),
     "trades": 0,
     "wins": 0,
     "losses": 0,
     "pnl": 0.0
 }
 
-last_summary_ts = time.time()
-
-MODES = [
-    ("agresivo", CAP_A, LOTS_A),
-    ("moderado", CAP_M, LOTS_M),
-    ("conservador", CAP_C, LOTS_C),
-]
+last_summary_ts = time.monotonic()
 
 def per_lot_cap(cap: float, lots: int) -> float:
     return cap / max(1, float(lots))
 
+# (modo, USD por lote) precalculado: cap y lots no cambian en ejecución
+MODE_META = [(mode, per_lot_cap(cap, lots)) for mode, cap, lots in MODES]
+
 def compute_order_qty(symbol: str, dollar_size: float, price: float):
     if price <= 0:
         return 0.0
     return float(round(dollar_size / price, 6))
 
-def compute_tp_sl(side: str, entry: float, tp_pct: float, sl_pct: float):
-    if side == "long":
-        tp = entry * (1.0 + tp_pct / 100.0)
-        sl = entry * (1.0 - sl_pct / 100.0)
-    else:
-        tp = entry * (1.0 - tp_pct / 100.0)
-        sl = entry * (1.0 + sl_pct / 100.0)
-    return tp, sl
+def compute_tp_sl(side: str, entry: float):
+    i = SIDE_IDX[side]
+    return entry * CFG.tp_mul[i], entry * CFG.sl_mul[i]
 
-def price_hit_take(side: str, price: float, tp: float) -> bool:
-    return (side == "long" and price >= tp) or (side == "short" and price <= tp)
+def price_hit_take(sign: float, price: float, tp: float) -> bool:
+    return sign * (price - tp) >= 0.0
 
-def price_hit_stop(side: str, price: float, sl: float) -> bool:
-    return (side == "long" and price <= sl) or (side == "short" and price >= sl)
+def price_hit_stop(sign: float, price: float, sl: float) -> bool:
+    return sign * (sl - price) >= 0.0
 
-def unrealized_pct(side: str, price: float, entry: float) -> float:
+def unrealized_pct(sign: float, price: float, entry: float) -> float:
     if entry <= 0:
         return 0.0
-    change = (price - entry) / entry * 100.0
-    return change if side == "long" else -change
+    return sign * (price - entry) / entry * 100.0
+
+def arm_breakeven(pos: Position):
+    pos.sl = pos.entry * CFG.be_mul[pos.side_idx]
+    pos.be_armed = True
 
 def maybe_arm_be_and_trail(pos: Position, price: float):
-    if ENABLE_BE and not pos.be_armed:
-        if unrealized_pct(pos.side, price, pos.entry) >= BE_TRIGGER_PCT:
-            offset = BE_OFFSET_PCT / 100.0
-            if pos.side == "long":
-                pos.sl = pos.entry * (1.0 + offset)
-            else:
-                pos.sl = pos.entry * (1.0 - offset)
-            pos.be_armed = True
-    if ENABLE_TRAIL and not pos.trail_armed:
-        if unrealized_pct(pos.side, price, pos.entry) >= TRAIL_TRIGGER_PCT:
-            step = TRAIL_STEP_PCT / 100.0
-            if pos.side == "long":
-                pos.trail_stop = price * (1.0 - step)
-            else:
-                pos.trail_stop = price * (1.0 + step)
+    if CFG.enable_be and not pos.be_armed:
+        if unrealized_pct(pos.sign, price, pos.entry) >= CFG.be_trigger_pct:
+            arm_breakeven(pos)
+    if CFG.enable_trail and not pos.trail_armed:
+        if unrealized_pct(pos.sign, price, pos.entry) >= CFG.trail_trigger_pct:
+            pos.trail_stop = price * CFG.trail_mul[pos.side_idx]
             pos.trail_armed = True
-    if ENABLE_TRAIL and pos.trail_armed and pos.trail_stop is not None:
-        step = TRAIL_STEP_PCT / 100.0
-        if pos.side == "long":
-            new_stop = price * (1.0 - step)
-            if new_stop > pos.trail_stop:
-                pos.trail_stop = new_stop
-        else:
-            new_stop = price * (1.0 + step)
-            if new_stop < pos.trail_stop:
-                pos.trail_stop = new_stop
+    if CFG.enable_trail and pos.trail_armed and pos.trail_stop is not None:
+        new_stop = price * CFG.trail_mul[pos.side_idx]
+        if pos.sign * (new_stop - pos.trail_stop) > 0.0:
+            pos.trail_stop = new_stop
 
 def hit_trailing_exit(pos: Position, price: float) -> bool:
-    if not (ENABLE_TRAIL and pos.trail_armed and pos.trail_stop):
+    if not (CFG.enable_trail and pos.trail_armed and pos.trail_stop):
         return False
-    return (pos.side == "long" and price <= pos.trail_stop) or (pos.side == "short" and price >= pos.trail_stop)
+    return pos.sign * (pos.trail_stop - price) >= 0.0
+
+def margin_setup_call(done: set, symbol: str, name: str, *args, required_params=None):
+    """Ejecuta set_margin_mode/set_leverage hasta que funcione una vez por símbolo.
+
+    `required_params` solo se envía si el exchange lo exige (ArgumentsRequired),
+    para no meter campos extra en la petición de los que no lo esperan.
+    """
+    if symbol in done:
+        return
+    method = getattr(exchange, name, None)
+    if method is None:
+        done.add(symbol)
+        return
+    try:
+        try:
+            method(*args, symbol)
+        except ccxt.ArgumentsRequired:
+            if not required_params:
+                raise
+            method(*args, symbol, required_params)
+    except (ccxt.NotSupported, ccxt.ArgumentsRequired, ccxt.NoChange) as e:
+        # Permanente (no soportado, o ya estaba así): no se reintenta
+        log.warning("%s %s: %s", name, symbol, e, extra={"symbol": symbol})
+    except Exception as e:
+        # Transitorio: se reintenta en la próxima apertura
+        log.warning("%s fallo %s: %s", name, symbol, e, extra={"symbol": symbol})
+        return
+    done.add(symbol)
 
 def place_open_order_live(symbol, side, qty):
-    mkt = markets.get(symbol)
     try:
-        if mkt and is_swap_symbol(mkt):
-            try:
-                if hasattr(exchange, "set_margin_mode"):
-                    exchange.set_margin_mode("cross", symbol)
-            except Exception:
-                pass
-            try:
-                if hasattr(exchange, "set_leverage"):
-                    exchange.set_leverage(3, symbol)
-            except Exception:
-                pass
+        if symbol in SWAP_SYMBOLS:
+            # CoinEx exige el apalancamiento también al fijar el modo de margen
+            margin_setup_call(margin_mode_ready, symbol, "set_margin_mode", "cross",
+                              required_params={"leverage": LEVERAGE})
+            margin_setup_call(leverage_ready, symbol, "set_leverage", LEVERAGE)
         side_ccxt = "buy" if side == "long" else "sell"
         return exchange.create_order(symbol, type="market", side=side_ccxt, amount=qty)
     except Exception as e:
-        log.error(f"create_order fallo {symbol} {side} qty={qty}: {e}")
+        log.error("create_order fallo %s %s qty=%s: %s", symbol, side, qty, e, extra={"symbol": symbol})
         return None
 
 def close_order_live(symbol, side, qty):
@@ -314,25 +684,58 @@ def close_order_live(symbol, side, qty):
         side_ccxt = "sell" if side == "long" else "buy"
         return exchange.create_order(symbol, type="market", side=side_ccxt, amount=qty)
     except Exception as e:
-        log.error(f"close_order fallo {symbol} {side} qty={qty}: {e}")
+        log.error("close_order fallo %s %s qty=%s: %s", symbol, side, qty, e, extra={"symbol": symbol})
         return None
 
+# Órdenes en segundo plano: un create_order lento no retrasa los SL de otras posiciones
+order_exec = ThreadPoolExecutor(max_workers=4, thread_name_prefix="orders")
+
+def submit_order(pos: Position, fn, *args, on_filled=None):
+    pos.pending_order = True
+    fut = order_exec.submit(fn, *args)
+
+    def _done(f):
+        try:
+            order = f.result()
+        except Exception as e:
+            log.error("orden fallo %s %s: %s", pos.symbol, pos.mode, e, extra={"symbol": pos.symbol})
+            order = None
+        if order:
+            log.info("Orden aceptada %s %s %s id=%s", pos.symbol, pos.mode, pos.side, order.get("id"),
+                     extra={"symbol": pos.symbol, "mode": pos.mode})
+            if on_filled is not None:
+                on_filled()
+        elif fn is place_open_order_live:
+            # La apertura no se ejecutó: se descarta la posición sin PnL ni aviso de cierre,
+            # para que un SL/TP posterior no envíe una orden contraria sin respaldo
+            pos.closed = True
+            pos.reason = "OPEN_FAILED"
+            row = positions[SYMBOL_IDX[pos.symbol]]
+            idx = MODE_IDX[pos.mode]
+            if row[idx] is pos:
+                row[idx] = None
+            log.error("Apertura no ejecutada, posición descartada: %s %s %s",
+                      pos.symbol, pos.mode, pos.side, extra={"symbol": pos.symbol, "mode": pos.mode})
+        pos.pending_order = False
+
+    fut.add_done_callback(_done)
+    return fut
+
 def fee_cost(notional: float) -> float:
-    return notional * (FEE_RATE * 2.0)
+    return notional * CFG.fee_round_trip
 
-def record_close(pos: Position, close_price: float, reason: str):
+def record_close(pos: Position, close_price: float, reason: str, now_ts: float):
     global current_capital, hourly_stats, last_loss_ts
 
     pos.closed = True
-    pos.closed_ts = time.time()
+    positions[SYMBOL_IDX[pos.symbol]][MODE_IDX[pos.mode]] = None
+    closed_positions.append(pos)
+    pos.closed_ts = now_ts
     pos.reason = reason
 
-    side = pos.side
     entry = pos.entry
     notional = pos.notional
-    ret_pct = (close_price - entry) / entry * 100.0
-    if side == "short":
-        ret_pct = -ret_pct
+    ret_pct = pos.sign * (close_price - entry) / entry * 100.0
     gross = notional * (ret_pct / 100.0)
     fees = fee_cost(notional)
     pnl = gross - fees
@@ -347,7 +750,7 @@ def record_close(pos: Position, close_price: float, reason: str):
         pnl_counters["wins"] += 1
     else:
         pnl_counters["losses"] += 1
-        last_loss_ts = time.time()
+        last_loss_ts = now_ts
 
     hourly_stats["trades"] += 1
     if pnl >= 0:
@@ -359,7 +762,7 @@ def record_close(pos: Position, close_price: float, reason: str):
     notifier.send_close(
         symbol=pos.symbol,
         mode=pos.mode.title(),
-        side=side.upper(),
+        side=pos.side.upper(),
         reason=reason,
         gross=gross,
         fees=fees,
@@ -371,116 +774,120 @@ def record_close(pos: Position, close_price: float, reason: str):
     )
     return pnl
 
-def open_position(symbol: str, mode: str, side: str, lot_usd: float, price: float, rsi_value=None):
+def open_position(symbol: str, mode: str, side: str, lot_usd: float, price: float, now_ts: float, rsi_value=None):
     qty = compute_order_qty(symbol, lot_usd, price)
     if qty <= 0:
         return None
-    tp, sl = compute_tp_sl(side, price, TAKE_PROFIT_PCT, STOP_LOSS_PCT)
+    tp, sl = compute_tp_sl(side, price)
     notional = lot_usd
-    pos = Position(symbol, mode, side, qty, price, tp, sl, time.time(), notional)
-    positions[(symbol, mode)] = pos
-
-    if LIVE == 1:
-        place_open_order_live(symbol, side, qty)
-
-    notifier.send_open(
-        symbol=symbol,
-        mode=mode.title(),
-        side=side.upper(),
-        lots=MODES[[m[0] for m in MODES].index(mode)][2],
-        entry=price,
-        sl=sl,
-        tp=tp,
-        timeframe=TIMEFRAME,
-        size_usd=lot_usd,
-        qty=qty,
-        rsi_value=rsi_value,
-        take_profit_pct=TAKE_PROFIT_PCT,
-        stop_loss_pct=STOP_LOSS_PCT
-    )
+    pos = Position(symbol, mode, side, qty, price, tp, sl, now_ts, notional)
+    positions[SYMBOL_IDX[symbol]][MODE_IDX[mode]] = pos
+
+    def announce():
+        notifier.send_open(
+            symbol=symbol,
+            mode=mode.title(),
+            side=side.upper(),
+            lots=MODE_LOTS[mode],
+            entry=price,
+            sl=sl,
+            tp=tp,
+            timeframe=CFG.timeframe,
+            size_usd=lot_usd,
+            qty=qty,
+            rsi_value=rsi_value,
+            take_profit_pct=CFG.take_profit_pct,
+            stop_loss_pct=CFG.stop_loss_pct
+        )
+
+    if CFG.live == 1:
+        # En LIVE solo se anuncia cuando el exchange acepta la orden de apertura
+        submit_order(pos, place_open_order_live, symbol, side, qty, on_filled=announce)
+    else:
+        announce()
     return pos
 
-def try_close_logic(symbol: str, mode: str, price: float):
-    pos = positions.get((symbol, mode))
+def try_close_logic(symbol: str, mode: str, price: float, now_ts: float):
+    pos = positions[SYMBOL_IDX[symbol]][MODE_IDX[mode]]
     if not pos or pos.closed:
         return
-    elapsed = time.time() - pos.opened_ts
+    # No se cierra nada hasta que el exchange confirme la orden anterior
+    if pos.pending_order:
+        return
+    elapsed = now_ts - pos.opened_ts
     maybe_arm_be_and_trail(pos, price)
 
     if hit_trailing_exit(pos, price):
-        if LIVE == 1:
-            close_order_live(pos.symbol, pos.side, pos.qty)
-        record_close(pos, price, "TRAIL")
+        if CFG.live == 1:
+            submit_order(pos, close_order_live, pos.symbol, pos.side, pos.qty)
+        record_close(pos, price, "TRAIL", now_ts)
         return
 
-    if not pos.partial_done and price_hit_take(pos.side, price, pos.tp):
-        part_pct = max(0.0, min(TP_PARTIAL_PCT, 100.0)) / 100.0
-        if part_pct > 0.0:
-            close_qty = pos.qty * part_pct
-            if LIVE == 1:
-                close_order_live(pos.symbol, pos.side, close_qty)
+    if not pos.partial_done and price_hit_take(pos.sign, price, pos.tp):
+        if CFG.tp_partial_frac > 0.0:
+            close_qty = pos.qty * CFG.tp_partial_frac
+            if CFG.live == 1:
+                submit_order(pos, close_order_live, pos.symbol, pos.side, close_qty)
             pos.qty -= close_qty
             pos.partial_done = True
-            if ENABLE_BE and not pos.be_armed:
-                offset = BE_OFFSET_PCT / 100.0
-                if pos.side == "long":
-                    pos.sl = pos.entry * (1.0 + offset)
-                else:
-                    pos.sl = pos.entry * (1.0 - offset)
-                pos.be_armed = True
-            notifier.send_partial_tp(symbol, mode.title(), pos.side.upper(), TP_PARTIAL_PCT, price)
-
-    if price_hit_stop(pos.side, price, pos.sl):
-        if LIVE == 1:
-            close_order_live(pos.symbol, pos.side, pos.qty)
-        record_close(pos, price, "SL")
+            if CFG.enable_be and not pos.be_armed:
+                arm_breakeven(pos)
+            notifier.send_partial_tp(symbol, mode.title(), pos.side.upper(), CFG.tp_partial_pct, price)
+
+    if price_hit_stop(pos.sign, price, pos.sl):
+        if CFG.live == 1:
+            submit_order(pos, close_order_live, pos.symbol, pos.side, pos.qty)
+        record_close(pos, price, "SL", now_ts)
         return
 
-    if elapsed >= TIMEOUT_MIN * 60:
-        if LIVE == 1:
-            close_order_live(pos.symbol, pos.side, pos.qty)
-        record_close(pos, price, "TIMEOUT")
+    if elapsed >= CFG.timeout_sec:
+        if CFG.live == 1:
+            submit_order(pos, close_order_live, pos.symbol, pos.side, pos.qty)
+        record_close(pos, price, "TIMEOUT", now_ts)
         return
 
-def signal_allowed(symbol: str, mode: str, side: str) -> bool:
-    now_ts = time.time()
-    key = (symbol, mode, side)
-    last_ts = last_signal_ts.get(key, 0)
-    if now_ts - last_ts < SIGNAL_COOLDOWN:
+def manage_open_positions(symbol: str, price: float, now_ts: float):
+    # Barre solo la fila del símbolo, saltando los huecos vacíos
+    for pos in positions[SYMBOL_IDX[symbol]]:
+        if pos is None or pos.closed:
+            continue
+        try_close_logic(symbol, pos.mode, price, now_ts)
+
+def signal_allowed(symbol: str, mode: str, side: str, now_ts: float) -> bool:
+    last_ts = last_signal_ts[SYMBOL_IDX[symbol]][MODE_IDX[mode]][SIDE_IDX[side]]
+    if now_ts - last_ts < CFG.signal_cooldown:
         return False
-    if last_loss_ts and (now_ts - last_loss_ts < LOSS_COOLDOWN_SEC):
+    if last_loss_ts and (now_ts - last_loss_ts < CFG.loss_cooldown_sec):
         return False
     return True
 
-def mark_signal(symbol: str, mode: str, side: str):
-    last_signal_ts[(symbol, mode, side)] = time.time()
+def mark_signal(symbol: str, mode: str, side: str, now_ts: float):
+    last_signal_ts[SYMBOL_IDX[symbol]][MODE_IDX[mode]][SIDE_IDX[side]] = now_ts
 
-def maybe_open_trades(symbol: str, rsi_value: float, price: float):
-    long_sig = rsi_value is not None and (rsi_value < RSI_BUY_THRESHOLD - RSI_HYST)
-    short_sig = rsi_value is not None and (rsi_value > RSI_SELL_THRESHOLD + RSI_HYST)
+def maybe_open_trades(symbol: str, rsi_value: float, price: float, now_ts: float):
+    long_sig = rsi_value is not None and rsi_value < CFG.rsi_long_below
+    short_sig = rsi_value is not None and rsi_value > CFG.rsi_short_above
+    if not (long_sig or short_sig):
+        return
 
-    for mode, cap, lots in MODES:
-        if cap <= 0:
+    row = positions[SYMBOL_IDX[symbol]]
+    for mode_idx, (mode, lot_usd) in enumerate(MODE_META):
+        if lot_usd <= 0:
             continue
-        key = (symbol, mode)
-        pos = positions.get(key)
+        pos = row[mode_idx]
         if pos and not pos.closed:
             continue
-        lot_usd = per_lot_cap(cap, lots)
-        if lot_usd <= 0:
-            continue
 
-        if long_sig and signal_allowed(symbol, mode, "long"):
-            open_position(symbol, mode, "long", lot_usd, price, rsi_value)
-            mark_signal(symbol, mode, "long")
+        if long_sig and signal_allowed(symbol, mode, "long", now_ts):
+            open_position(symbol, mode, "long", lot_usd, price, now_ts, rsi_value)
+            mark_signal(symbol, mode, "long", now_ts)
 
-        elif short_sig and signal_allowed(symbol, mode, "short"):
-            open_position(symbol, mode, "short", lot_usd, price, rsi_value)
-            mark_signal(symbol, mode, "short")
+        elif short_sig and signal_allowed(symbol, mode, "short", now_ts):
+            open_position(symbol, mode, "short", lot_usd, price, now_ts, rsi_value)
+            mark_signal(symbol, mode, "short", now_ts)
 
-def heartbeat_summary():
+def heartbeat_summary(now_ts: float):
     global last_summary_ts, hourly_stats, current_capital
-    now_ts = time.time()
     if now_ts - last_summary_ts >= 3600:
         notifier.send_hourly_summary(
             total_capital=current_capital,
@@ -508,42 +915,77 @@ signal.signal(signal.SIGTERM, handle_sigterm)
 signal.signal(signal.SIGINT, handle_sigterm)
 
 def boot_banner():
-    caps = f"A {CAP_A}/x{LOTS_A} · M {CAP_M}/x{LOTS_M} · C {CAP_C}/x{LOTS_C}"
-    mode_txt = "LIVE" if LIVE == 1 else "PAPER 🧪"
+    caps = f"A {CFG.cap_a}/x{CFG.lots_a} · M {CFG.cap_m}/x{CFG.lots_m} · C {CFG.cap_c}/x{CFG.lots_c}"
+    mode_txt = "LIVE" if CFG.live == 1 else "PAPER 🧪"
     txt = (
         f"🚀 BOT ZAFFEX - CON RESUMEN HORARIO\n"
-        f"🧩 Exchange: {EXCHANGE_ID} | Modo: {mode_txt}\n"
-        f"💰 Capital inicial: ${INITIAL_CAPITAL:,.2f}\n"
-        f"📊 RSI({RSI_PERIOD}) — Buy < {RSI_BUY_THRESHOLD} / Sell > {RSI_SELL_THRESHOLD}\n"
-        f"🎯 TP/SL: {TAKE_PROFIT_PCT:.1f}% / {STOP_LOSS_PCT:.1f}%\n"
-        f"📈 Símbolos: {', '.join(SYMBOLS)}\n"
+        f"🧩 Exchange: {CFG.exchange_id} | Modo: {mode_txt}\n"
+        f"💰 Capital inicial: ${CFG.initial_capital:,.2f}\n"
+        f"📊 RSI({CFG.rsi_period}) — Buy < {CFG.rsi_buy_threshold} / Sell > {CFG.rsi_sell_threshold}\n"
+        f"🎯 TP/SL: {CFG.take_profit_pct:.1f}% / {CFG.stop_loss_pct:.1f}%\n"
+        f"📈 Símbolos: {', '.join(CFG.symbols)}\n"
     )
     notifier.broadcast(txt)
 
-def main():
+async def main():
     boot_banner()
     api_key = os.getenv("API_KEY", "")
     def mask(s): return f"{s[:3]}...{s[-3:]}" if s and len(s) > 6 else "***"
-    log.info(f"API key: {mask(api_key)}")
+    log.info("API key: %s", mask(api_key))
     log.info("✅ Bot iniciado correctamente. Entrando al bucle principal...")  # ← LOG DE DIAGNÓSTICO
 
     global _running
-    while _running:
-        log.info("🔄 Bucle activo: consultando precios y RSI...")  # ← LOG DE DIAGNÓSTICO (solo para pruebas)
-        try:
-            for symbol in SYMBOLS:
-                price, rsi_val = fetch_price_and_rsi(symbol)
-                if price is None:
-                    continue
-                for mode, _, _ in MODES:
-                    try_close_logic(symbol, mode, price)
-                maybe_open_trades(symbol, rsi_val or 50.0, price)
-            heartbeat_summary()
-            time.sleep(POLL_SEC)
-        except Exception as e:
-            log.error(f"Loop error: {e}")
-            time.sleep(2)
+    ws_task = None
+    if CFG.ws_feed and data_exchange.has.get("watchTickers"):
+        ws_task = asyncio.create_task(watch_prices())
+    next_tick = time.monotonic()
+    try:
+        while _running:
+            log.info("🔄 Bucle activo: consultando precios y RSI...")  # ← LOG DE DIAGNÓSTICO (solo para pruebas)
+            try:
+                # Un solo reloj de pared por tick: todas las velas se comparan contra el mismo corte
+                closed_ts = last_closed_bar_ts()
+                prices = await fetch_prices()
+                results = await asyncio.gather(
+                    *[fetch_price_and_rsi(s, closed_ts, prices.get(s)) for s in CFG.symbols],
+                    return_exceptions=True
+                )
+                quotes = {}
+                for symbol, res in zip(CFG.symbols, results):
+                    if isinstance(res, Exception):
+                        log.error("Fetch error %s: %s", symbol, res, extra={"symbol": symbol})
+                        continue
+                    if res[0] is not None:
+                        quotes[symbol] = res
+                # Reloj monotónico: cooldowns y timeouts inmunes a saltos de NTP
+                now_ts = time.monotonic()
+                # Cierres y aperturas símbolo a símbolo, en el orden de SYMBOLS: un SL en un
+                # símbolo posterior no debe bloquear (vía last_loss_ts) una entrada anterior
+                for symbol, (price, rsi_val) in quotes.items():
+                    manage_open_positions(symbol, price, now_ts)
+                    if rsi_val is not None:
+                        maybe_open_trades(symbol, rsi_val, price, now_ts)
+                heartbeat_summary(now_ts)
+                # Cadencia fija: el tiempo de trabajo se descuenta del sleep
+                next_tick += CFG.poll_sec
+                delay = next_tick - time.monotonic()
+                if delay < -CFG.poll_sec:
+                    log.warning("Bucle atrasado %.1fs, realineando", -delay)
+                    next_tick = time.monotonic()
+                    delay = 0.0
+                await asyncio.sleep(max(0.0, delay))
+            except Exception as e:
+                log.error("Loop error: %s", e)
+                await asyncio.sleep(2)
+                next_tick = time.monotonic()
+    finally:
+        if ws_task is not None:
+            ws_task.cancel()
+        # Deja terminar las órdenes ya enviadas antes de cerrar
+        order_exec.shutdown(wait=True)
+        await data_exchange.close()
+        notifier.close()
     log.info("[EXIT] Loop detenido.")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -1,10 +1,25 @@
 # telegram_notifier.py
 # -*- coding: utf-8 -*-
+import json
+import time
+import queue
+import threading
 import requests
 import logging
 
+try:
+    import orjson
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except Exception:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
 log = logging.getLogger("tg")
 
+# Límite de Telegram para el texto de un mensaje
+MAX_MESSAGE_LEN = 4096
+
 def _fmt_money(x: float) -> str:
     sign = "" if x >= 0 else "-"
     v = abs(x)
@@ -31,7 +46,8 @@ def TPtoSL(entry: float, tp: float, sl: float) -> float:
     return round(up / dn, 1)
 
 class TelegramNotifier:
-    def __init__(self, token: str = "", allowed_chat_ids=None, **kwargs):
+    def __init__(self, token: str = "", allowed_chat_ids=None, queue_size: int = 1000,
+                 batch_window: float = 0.5, max_retries: int = 3, **kwargs):
         self.token = token or ""
         self.allowed = []
         if allowed_chat_ids:
@@ -42,24 +58,112 @@ class TelegramNotifier:
                     pass
         self.api = f"https://api.telegram.org/bot{self.token}" if self.token else ""
         self.session = requests.Session() if self.token else None
+        # Los envíos van por un hilo aparte para no bloquear el bucle de trading
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        # symbol -> spec de formato de precio; se rellena al cargar los mercados
+        self.price_formats = {}
+        self._worker = None
+        if self.session and self.api and self.allowed:
+            self._worker = threading.Thread(target=self._run, name="tg-sender", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch, stop = self._collect(item)
+            for text, disable_preview in batch:
+                self._send(text, disable_preview)
+            if stop:
+                break
+
+    def _collect(self, first):
+        # Agrupa lo que llegue dentro de la ventana en un solo mensaje por destino
+        batch = [list(first)]
+        deadline = time.monotonic() + self.batch_window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            text, disable_preview = item
+            last = batch[-1]
+            if last[1] == disable_preview and len(last[0]) + len(text) + 2 <= MAX_MESSAGE_LEN:
+                last[0] = f"{last[0]}\n\n{text}"
+            else:
+                batch.append([text, disable_preview])
+        return batch, False
+
+    def close(self, timeout: float = 10.0):
+        if self._worker is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._worker.join(timeout)
 
     def _post(self, text: str, disable_web_page_preview: bool = True):
-        if not self.session or not self.api or not self.allowed:
+        if self._worker is None:
             return
-        for chat_id in self.allowed:
+        item = (text, disable_web_page_preview)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Cola llena: se descarta el mensaje más antiguo en vez de acumular retraso
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            log.warning("Telegram queue full, dropping oldest message")
             try:
-                self.session.post(
-                    f"{self.api}/sendMessage",
-                    json={
-                        "chat_id": chat_id,
-                        "text": text,
-                        "parse_mode": "HTML",
-                        "disable_web_page_preview": disable_web_page_preview
-                    },
-                    timeout=10
-                )
-            except Exception as e:
-                log.warning(f"Telegram send fail: {e}")
+                self.queue.put_nowait(item)
+            except queue.Full:
+                pass
+
+    def _send(self, text: str, disable_web_page_preview: bool = True):
+        body = {
+            "text": text,
+            "parse_mode": "HTML",
+            "disable_web_page_preview": disable_web_page_preview
+        }
+        for chat_id in self.allowed:
+            body["chat_id"] = chat_id
+            data = _dumps(body)
+            for attempt in range(self.max_retries + 1):
+                try:
+                    resp = self.session.post(
+                        f"{self.api}/sendMessage",
+                        data=data,
+                        headers={"Content-Type": "application/json"},
+                        timeout=10
+                    )
+                except Exception as e:
+                    log.warning("Telegram send fail: %s", e)
+                    break
+                if resp.status_code != 429:
+                    break
+                if attempt == self.max_retries:
+                    log.warning("Telegram 429 for chat %s, giving up after %d attempts", chat_id, attempt + 1)
+                    break
+                # Rate limit: esperar lo que pide Telegram y reintentar solo este chat
+                try:
+                    retry_after = float(resp.json()["parameters"]["retry_after"])
+                except Exception:
+                    retry_after = 1.0
+                log.warning("Telegram 429 for chat %s, retrying in %.1fs", chat_id, retry_after)
+                time.sleep(retry_after)
+
+    def fmt_price(self, symbol, x: float) -> str:
+        return self.price_formats.get(symbol, "{:,.4f}").format(x)
 
     def broadcast(self, text: str):
         self._post(text)
@@ -74,9 +178,9 @@ class TelegramNotifier:
             f"{'🟢' if side == 'LONG' else '🔴'} <b>{side}</b> | {symbol}\n\n"
             f"📊 <b>Modo:</b> {mode} ({lots} lotes)\n"
             f"💰 <b>Capital:</b> ${size_usd:,.2f}\n"
-            f"📈 <b>Entrada:</b> ${entry:,.4f}\n"
-            f"✅ <b>TP:</b> ${tp:,.4f} ({tp_pct})\n"
-            f"🛑 <b>SL:</b> ${sl:,.4f} ({sl_pct})\n"
+            f"📈 <b>Entrada:</b> ${self.fmt_price(symbol, entry)}\n"
+            f"✅ <b>TP:</b> ${self.fmt_price(symbol, tp)} ({tp_pct})\n"
+            f"🛑 <b>SL:</b> ${self.fmt_price(symbol, sl)} ({sl_pct})\n"
             f"⚖️ <b>R:R</b> = 1:{rr:.1f}\n"
             f"🕒 <b>TF:</b> {timeframe} | RSI: {rsi_txt}\n"
         )
@@ -87,7 +191,7 @@ class TelegramNotifier:
             f"🟢 <b>TP Parcial</b>\n\n"
             f"🪙 <b>Símbolo:</b> {symbol}\n"
             f"🎯 <b>Modo:</b> {mode} · {side}\n"
-            f"🔹 <b>Ejecutado:</b> {partial_pct:.0f}% @ ${price:,.4f}\n"
+            f"🔹 <b>Ejecutado:</b> {partial_pct:.0f}% @ ${self.fmt_price(symbol, price)}\n"
         )
         self._post(text)
 
@@ -98,7 +202,7 @@ class TelegramNotifier:
         text = (
             f"{emoji} <b>OPERACIÓN CERRADA</b>\n"
             f"{'🟢' if side == 'LONG' else '🔴'} {symbol} | {mode}\n\n"
-            f"📍 <b>Entrada:</b> ${entry:,.4f} → <b>Salida:</b> ${exit_price:,.4f}\n"
+            f"📍 <b>Entrada:</b> ${self.fmt_price(symbol, entry)} → <b>Salida:</b> ${self.fmt_price(symbol, exit_price)}\n"
             f"📊 <b>PnL:</b> {_fmt_money(pnl)} ({change_pct:.2f}%)\n"
             f"💰 <b>Capital actual:</b> ${current_capital:,.2f}\n"
             f"⏱️ <b>Duración:</b> {dur} | <b>Razón:</b> {reason}\n"